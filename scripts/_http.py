@@ -0,0 +1,46 @@
+import json
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+    _json_dumps = orjson.dumps
+except ImportError:  # stdlib fallback; json.loads accepts bytes too
+    _json_loads = json.loads
+
+    def _json_dumps(obj):
+        return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+USER_AGENT = "disa-intel-engine/1.0"
+POOL_SIZE = 16
+POOL_CONNECTIONS = 16
+
+# Built once at import: every default-sized session mounts this same adapter and so
+# shares its connection pools. No urllib3 Retry on it; callers own the retry policy.
+_ADAPTER = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_SIZE)
+
+def _build_session(pool_maxsize=POOL_SIZE):
+    # Keep-alive pools to api.usaspending.gov, sized for the concurrent page fetches.
+    s = requests.Session()
+    s.headers.update({"User-Agent": USER_AGENT})
+    if pool_maxsize == POOL_SIZE:
+        adapter = _ADAPTER
+    else:
+        adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=pool_maxsize)
+    s.mount("https://", adapter)
+    return s
+
+def _json_body(r):
+    # Raise on HTTP errors, then parse the raw bytes: skips requests' charset detection
+    # (r.json() decodes to str first) and the extra str copy of every payload.
+    r.raise_for_status()
+    return _json_loads(r.content)
+
+# Built once per process: the call sites within a run share one set of warm
+# connections instead of each paying its own TCP + TLS handshake. Separate script
+# runs (e.g. the healthcheck and the pull) are separate processes and share nothing.
+SESSION = _build_session()
@@ -1,13 +1,31 @@
 import csv
 import json
 import os
+import re
+import sys
 import time
-from datetime import date, datetime, timedelta
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from functools import lru_cache, partial
 import requests
 
+from _http import JSON_HEADERS, POOL_SIZE, SESSION, _build_session, _json_body, _json_dumps, _json_loads
+
 API_URL = "https://api.usaspending.gov/api/v2/search/spending_by_award/"
+COUNT_URL = "https://api.usaspending.gov/api/v2/search/spending_by_award_count/"
+# Every row pulled from the API, one JSON object per line; RAW_REPLAY=1 reads it back.
+RAW_PATH = "output/disa_cyber_expiring_raw.ndjson"
+# Query settings and coverage of the run that wrote RAW_PATH, checked before a replay.
+RAW_META_PATH = "output/disa_cyber_expiring_raw_meta.json"
+DISA_SUBTIER_NAME = "Defense Information Systems Agency"
+# Largest page size the endpoint is documented to accept, and the default. An explicit
+# larger PAGE_LIMIT is tried first and negotiated down on 400/422.
+SAFE_PAGE_LIMIT = 100
 
-FIELDS = [
+FIELDS = (
     "Award ID",
     "Recipient Name",
     "Award Amount",
@@ -21,16 +39,41 @@ FIELDS = [
     "End Date",
     "Last Modified Date",
     "Description",
-]
+)
+
+# Low-cardinality columns: the same few agency names and PSC/NAICS labels repeat on
+# thousands of kept rows, so each is interned to one shared str instance.
+_INTERN_COLS = tuple(
+    FIELDS.index(k)
+    for k in (
+        "Awarding Agency",
+        "Awarding Sub Agency",
+        "Funding Agency",
+        "Funding Sub Agency",
+        "PSC",
+        "NAICS",
+    )
+)
 
 def _truthy(s: str) -> bool:
     return str(s).strip().lower() in ("1", "true", "yes", "y", "on")
 
+@lru_cache(maxsize=4096)
+def _fmt_code_name(code, name):
+    # PSC/NAICS objects repeat across most rows; format each distinct pair once.
+    return f"{code} - {name}"
+
+def _code_name(code, name):
+    try:
+        return _fmt_code_name(code, name)
+    except TypeError:  # unhashable code/name: format directly
+        return f"{code} - {name}"
+
 def _normalize(v):
     # USAspending sometimes returns objects/lists for fields; keep CSV readable.
     if isinstance(v, dict):
         if "code" in v and "name" in v:
-            return f"{v['code']} - {v['name']}"
+            return _code_name(v["code"], v["name"])
         if "code" in v:
             return str(v["code"])
         return json.dumps(v, ensure_ascii=False)
@@ -38,6 +81,39 @@ def _normalize(v):
         return "; ".join(_normalize(x) for x in v)
     return "" if v is None else str(v)
 
+def _extract_row(row):
+    return [_normalize(row.get(k, "")) for k in FIELDS]
+
+# Per-field expressions for _compile_extractor, keyed by the one value type a field
+# showed on the first page. Each checks the type again and falls back to _normalize,
+# so a row that breaks the pattern still comes out exactly as _normalize would have it.
+_EXTRACT_EXPRS = {
+    str: "(v if (v := get({k!r}, \"\")).__class__ is str else norm(v))",
+    int: "(str(v) if (v := get({k!r}, \"\")).__class__ is int else norm(v))",
+    float: "(str(v) if (v := get({k!r}, \"\")).__class__ is float else norm(v))",
+    dict: (
+        "(fmt(v[\"code\"], v[\"name\"]) if (v := get({k!r}, \"\")).__class__ is dict"
+        " and \"code\" in v and \"name\" in v else norm(v))"
+    ),
+}
+
+def _compile_extractor(sample):
+    # The USAspending schema is fixed for a run, so after page 1 generate a row -> list
+    # function with each field's conversion written out inline, instead of running the
+    # _normalize isinstance chain on every value. Fields with no single observed type
+    # (all None, lists, mixed) keep the generic _normalize call.
+    if not sample:
+        return _extract_row
+    exprs = []
+    for k in FIELDS:
+        types = {type(r.get(k)) for r in sample[:50]} - {type(None)}
+        t = types.pop() if len(types) == 1 else None
+        exprs.append(_EXTRACT_EXPRS[t].format(k=k) if t in _EXTRACT_EXPRS else f"norm(get({k!r}, \"\"))")
+    src = "def extract(row):\n    get = row.get\n    return [\n" + "".join(f"        {e},\n" for e in exprs) + "    ]\n"
+    ns = {"norm": _normalize, "fmt": _code_name}
+    exec(compile(src, "<extract>", "exec"), ns)
+    return ns["extract"]
+
 def _parse_iso_date(s):
     if not s:
         return None
@@ -47,154 +123,410 @@ def _parse_iso_date(s):
     except Exception:
         return None
 
+# Prefer "End Date" (your requested field)
+# but allow a couple of common fallbacks (sometimes appear in other endpoints/fields).
+_END_KEYS = (
+    "End Date",
+    "period_of_performance_current_end_date",
+    "Period of Performance Current End Date",
+    "period_of_performance_potential_end_date",
+    "Period of Performance Potential End Date",
+)
+
 def _get_end_date(row):
-    # Prefer "End Date" (your requested field)
-    # but allow a couple of common fallbacks (sometimes appear in other endpoints/fields).
-    return (
-        row.get("End Date")
-        or row.get("Period of Performance Current End Date")
-        or row.get("Period of Performance Potential End Date")
-        or ""
-    )
+    # First non-empty value in _END_KEYS order.
+    return next((row[k] for k in _END_KEYS if row.get(k)), "")
+
+def _end_date_getter(sample):
+    # Every row in one response uses the same end-date key, so look at the sample once:
+    # if exactly one of the keys shows up, read that key directly instead of walking
+    # the chain. (Not operator.itemgetter: a null End Date must still come back as "".)
+    # Later pages pass just their first row, which keeps the check O(1) per page.
+    present = [k for k in _END_KEYS if any(k in r for r in sample[:50])]
+    if len(present) != 1:
+        return _get_end_date
+    key = present[0]
+    return lambda row: row.get(key) or ""
+
+# One case-insensitive alternation, compiled at import; _is_disa runs for every pulled row.
+# "DISA" must be a whole word so names like "Office of Disability ..." do not match.
+_DISA_RE = re.compile(r"defense information systems agency|\bdisa\b", re.IGNORECASE)
 
 def _is_disa(row) -> bool:
     # Most reliable: look for DISA in the sub-agency fields (and also check agency fields).
-    needles = ("Defense Information Systems Agency", "DISA")
-    hay_fields = (
-        "Awarding Sub Agency",
-        "Funding Sub Agency",
-        "Awarding Agency",
-        "Funding Agency",
+    # One haystack per row; \x1f keeps a match from spanning two fields.
+    hay = (
+        (row.get("Awarding Sub Agency") or "")
+        + "\x1f" + (row.get("Funding Sub Agency") or "")
+        + "\x1f" + (row.get("Awarding Agency") or "")
+        + "\x1f" + (row.get("Funding Agency") or "")
     )
-    for f in hay_fields:
-        val = (row.get(f) or "")
-        if any(n.lower() in val.lower() for n in needles):
-            return True
-    return False
+    return _DISA_RE.search(hay) is not None
+
+def _filter_rows(rows, disa_only, start, end, kept, seen, get_end=_get_end_date, extract=_extract_row):
+    # Applies both local filters to one page as it arrives and appends survivors to
+    # `kept` already flattened to FIELDS order, so raw pages never pile up in memory.
+    # Rows whose award was already seen on an earlier page (page overlap from retries
+    # or records inserted mid-run) are skipped before any filtering.
+    # `start`/`end` are YYYY-MM-DD strings: ISO dates order the same as strings, so
+    # the window check is a plain string compare with no date object per row.
+    # Returns how many rows passed the DISA filter (for the debug counts).
+    # This is the per-row kernel, so globals and bound methods are hoisted into locals.
+    is_disa, keep = _is_disa, kept.append
+    intern, intern_cols = sys.intern, _INTERN_COLS
+    disa_count = 0
+    for row in rows:
+        aid = row.get("generated_internal_id") or row.get("Award ID")
+        if aid:
+            if aid in seen:
+                continue
+            seen.add(aid)
+        if disa_only and not is_disa(row):
+            continue
+        disa_count += 1
+        ed = get_end(row)[:10]
+        if ed and (start <= ed <= end):
+            out = extract(row)
+            for i in intern_cols:
+                out[i] = intern(out[i])
+            keep(out)
+    return disa_count
+
+def _past_window(rows, get_end, end):
+    # With results sorted by End Date ascending, a page whose last row ends after the
+    # window means every later page does too. Missing dates ("") never trigger it.
+    return bool(rows) and get_end(rows[-1])[:10] > end
+
+def _retry_after(r):
+    # Retry-After from a 429/503, as delta-seconds or an HTTP date; None if absent.
+    value = (r.headers.get("Retry-After") or "").strip() if r is not None else ""
+    if not value:
+        return None
+    if value.isdigit():
+        return int(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0, round((when - datetime.now(timezone.utc)).total_seconds()))
 
 def _post_with_retries(session, url, body, timeout=(20, 120), attempts=6):
     # Handles random disconnects + 429/5xx with backoff.
+    # Encoded once here (orjson when available) rather than by requests on every attempt.
+    payload = _json_dumps(body)
     for i in range(1, attempts + 1):
         try:
-            r = session.post(url, json=body, timeout=timeout)
+            r = session.post(url, data=payload, headers=JSON_HEADERS, timeout=timeout)
             if r.status_code in (429, 500, 502, 503, 504):
                 raise requests.HTTPError(f"retryable status {r.status_code}", response=r)
             return r
         except requests.RequestException as e:
             if i == attempts:
                 raise
-            sleep_s = min(60, 2 ** (i - 1))
+            # Wait as long as the server asks when it says so; otherwise back off exponentially.
+            advised = _retry_after(e.response)
+            sleep_s = min(60, 2 ** (i - 1) if advised is None else advised)
             print(f"Request failed ({type(e).__name__}: {e}). Retry {i}/{attempts} in {sleep_s}s...")
             time.sleep(sleep_s)
 
+def _expected_pages(total, limit, max_pages):
+    # Page count implied by a result total, capped at max_pages; max_pages when unknown.
+    if not isinstance(total, int) or isinstance(total, bool):
+        return max_pages
+    return min(max_pages, max(1, -(-total // limit)))
+
+def _fetch_total(session, body):
+    # Pre-flight count of matching awards from the cheap count endpoint, so the page
+    # fetches can be sized without waiting on hasNext. Best effort: one short attempt,
+    # and on any failure the paging loop just follows hasNext as before.
+    try:
+        r = _post_with_retries(
+            session, COUNT_URL, {"filters": body["filters"], "subawards": body["subawards"]},
+            timeout=(5, 10), attempts=1,
+        )
+        counts = _json_body(r).get("results") or {}
+        return sum(v for v in counts.values() if isinstance(v, int))
+    except (requests.RequestException, ValueError, AttributeError):
+        return None
+
+def _write_raw(raw_out, rows):
+    if raw_out is not None:
+        raw_out.write(b"".join(_json_dumps(row) + b"\n" for row in rows))
+
+def _load_raw(path):
+    with open(path, "rb") as f:
+        return [_json_loads(line) for line in f if line.strip()]
+
+def _check_replay(raw_meta, cfg, end):
+    # The cache only holds what its live run pulled: refuse a replay that would need
+    # rows that run never asked for, rather than write a silently short CSV.
+    problems = []
+    if raw_meta.get("psc_codes") != list(cfg.psc_codes):
+        problems.append(f"PSC_CODES {list(cfg.psc_codes)} != cached {raw_meta.get('psc_codes')}")
+    if raw_meta.get("disa_api_filter") != cfg.disa_api_filter:
+        problems.append(
+            f"API-side DISA filter {cfg.disa_api_filter} != cached {raw_meta.get('disa_api_filter')}"
+        )
+    covered = raw_meta.get("covered_through")
+    if not raw_meta.get("complete") and not (covered and end < covered):
+        # The live run stopped early (past its window or at MAX_PAGES); rows sort by End
+        # Date, so it has every row ending before its last pulled End Date and no more.
+        problems.append(f"END_DATE {end} is not before the cache's coverage limit ({covered or 'unknown'})")
+    if problems:
+        raise SystemExit(f"RAW_REPLAY refused, {RAW_PATH} does not cover this query: " + "; ".join(problems))
+
+def _replay_page(raw, limit, page):
+    # Serves cached rows in API-sized pages so replay runs through the same paging loop.
+    return raw[(page - 1) * limit:page * limit], {"page": page, "hasNext": page * limit < len(raw)}
+
+def _page_data(r):
+    data = _json_body(r)
+    return data.get("results", []) or [], data.get("page_metadata", {}) or {}
+
+def _fetch_page(session, body, page):
+    # Each worker posts its own copy of the body so pages can be in flight together.
+    return _page_data(_post_with_retries(session, API_URL, {**body, "page": page}))
+
+def _fetch_first_page(session, body):
+    # Start from the requested page size and halve on 400/422 until the API accepts it.
+    # The negotiated size is written back into body so every later page uses it.
+    while True:
+        r = _post_with_retries(session, API_URL, {**body, "page": 1})
+        if r.status_code in (400, 422) and body["limit"] > SAFE_PAGE_LIMIT:
+            body["limit"] = max(SAFE_PAGE_LIMIT, body["limit"] // 2)
+            continue
+        rows, meta = _page_data(r)
+        print(f"Page size: {body['limit']}")
+        return rows, meta
+
+@dataclass(frozen=True)
+class Config:
+    horizon_days: int
+    psc_codes: tuple
+    max_pages: int
+    disa_only: bool
+    disa_api_filter: bool
+    concurrency: int
+    page_limit: int
+    end_date: date | None
+    raw_replay: bool
+
+    @classmethod
+    def from_env(cls):
+        # Every env input is read and validated once, up front; main() and the helpers
+        # only see the parsed values.
+        disa_only = _truthy(os.getenv("DISA_ONLY", "1"))
+        # Optional END_DATE override (useful for “through 2026-03-01” testing)
+        end_date_override = os.getenv("END_DATE", "").strip()
+        end_date = None
+        if end_date_override:
+            end_date = _parse_iso_date(end_date_override)
+            if not end_date:
+                raise ValueError(f"END_DATE must be YYYY-MM-DD, got: {end_date_override!r}")
+        return cls(
+            horizon_days=int(os.getenv("HORIZON_DAYS", "365")),
+            psc_codes=tuple(s.strip() for s in os.getenv("PSC_CODES", "D310").split(",") if s.strip()),
+            max_pages=int(os.getenv("MAX_PAGES", "25")),
+            disa_only=disa_only,
+            # Opt-in: push the DISA filter to the API (awarding sub-tier only). Off by default
+            # because it drops awards DISA funded but did not award, which the local
+            # _is_disa match keeps; DISA_API_FILTER=1 trades those rows for smaller pulls.
+            disa_api_filter=disa_only and _truthy(os.getenv("DISA_API_FILTER", "0")),
+            concurrency=max(1, int(os.getenv("PAGE_CONCURRENCY", "8"))),
+            page_limit=max(1, int(os.getenv("PAGE_LIMIT", str(SAFE_PAGE_LIMIT)))),
+            end_date=end_date,
+            raw_replay=_truthy(os.getenv("RAW_REPLAY", "0")),
+        )
+
 def main():
-    # Inputs from env
-    horizon_days = int(os.getenv("HORIZON_DAYS", "365"))
-    disa_only = _truthy(os.getenv("DISA_ONLY", "1"))
-    psc_codes = [s.strip() for s in os.getenv("PSC_CODES", "D310").split(",") if s.strip()]
-    max_pages = int(os.getenv("MAX_PAGES", "25"))
+    cfg = Config.from_env()
+    disa_only, max_pages, concurrency = cfg.disa_only, cfg.max_pages, cfg.concurrency
 
     start_dt = date.today()
-    # Optional END_DATE override (useful for “through 2026-03-01” testing)
-    end_date_override = os.getenv("END_DATE", "").strip()
-    if end_date_override:
-        end_dt = _parse_iso_date(end_date_override)
-        if not end_dt:
-            raise ValueError(f"END_DATE must be YYYY-MM-DD, got: {end_date_override!r}")
-    else:
-        end_dt = start_dt + timedelta(days=horizon_days)
-
-    # Build request body (NOTE: we do NOT try to filter DISA inside the API call)
+    end_dt = cfg.end_date or start_dt + timedelta(days=cfg.horizon_days)
+
+    # Build request body
     body = {
         "subawards": False,
-        "limit": 100,
-        "page": 1,
+        "limit": cfg.page_limit,
         "sort": "End Date",
         "order": "asc",
         "filters": {
             "award_type_codes": ["A", "B", "C", "D"],  # procurement contracts
-            "psc_codes": psc_codes,
+            "psc_codes": list(cfg.psc_codes),
         },
         "fields": FIELDS,
     }
+    if cfg.disa_api_filter:
+        # Only the awarding side: the API ANDs awarding and funding agency filters,
+        # which would drop rows the local match keeps. _is_disa still runs afterwards.
+        body["filters"]["agencies"] = [
+            {"type": "awarding", "tier": "subtier", "name": DISA_SUBTIER_NAME},
+        ]
 
-    print(f"Query PSC codes: {psc_codes}")
-    print(f"Filter DISA only: {disa_only}")
-    print(f"End Date window: {start_dt.isoformat()} -> {end_dt.isoformat()}")
+    print(f"Query PSC codes: {list(cfg.psc_codes)}")
+    print(f"Filter DISA only: {disa_only} (API-side: {cfg.disa_api_filter})")
+    start, end = start_dt.isoformat(), end_dt.isoformat()
+    print(f"End Date window: {start} -> {end}")
 
-    session = requests.Session()
-    session.headers.update({"User-Agent": "disa-intel-engine/1.0"})
+    os.makedirs("output", exist_ok=True)
 
-    all_rows = []
-    page = 1
-    first_page_sample = None
-    first_page_meta = None
+    pulled_total = 0
+    disa_total = 0
+    kept = []
+    seen = set()
 
-    while True:
-        body["page"] = page
-        r = _post_with_retries(session, API_URL, body)
-        r.raise_for_status()
-        data = r.json()
-
-        rows = data.get("results", []) or []
-        meta = data.get("page_metadata", {}) or {}
-
-        if page == 1:
-            first_page_meta = meta
-            first_page_sample = rows[:3]
-            print(f"Page 1 results: {len(rows)}")
-            if rows:
-                print(f"Sample Award IDs: {[x.get('Award ID') for x in rows[:5]]}")
-
-        if not rows:
-            break
-
-        all_rows.extend(rows)
-
-        if not meta.get("hasNext"):
-            break
-
-        page += 1
-        if page > max_pages:
-            print(f"Stopping at {max_pages} pages (safety stop).")
-            break
-
-    # Local filters
-    # 1) DISA only
-    if disa_only:
-        disa_rows = [row for row in all_rows if _is_disa(row)]
-    else:
-        disa_rows = list(all_rows)
-
-    # 2) End Date window
-    filtered = []
-    for row in disa_rows:
-        ed_raw = _get_end_date(row)
-        ed = _parse_iso_date(ed_raw)
-        if ed and (start_dt <= ed <= end_dt):
-            filtered.append(row)
-
-    # Write CSV
-    os.makedirs("output", exist_ok=True)
-    csv_path = "output/disa_cyber_expiring.csv"
-    with open(csv_path, "w", newline="", encoding="utf-8") as f:
-        w = csv.DictWriter(f, fieldnames=FIELDS)
-        w.writeheader()
-        for row in filtered:
-            w.writerow({k: _normalize(row.get(k, "")) for k in FIELDS})
+    # A live run streams the cache into a temp file and only swaps it in once the pull
+    # has finished, so a failed run leaves the previous cache intact.
+    raw_out = None if cfg.raw_replay else open(RAW_PATH + ".tmp", "wb", buffering=1 << 20)
+    try:
+        if cfg.raw_replay:
+            # Re-run the filters over the rows saved by the last live run, without any API
+            # calls (e.g. a narrower END_DATE); _check_replay rejects what the cache can't cover.
+            for path in (RAW_PATH, RAW_META_PATH):
+                if not os.path.exists(path):
+                    raise SystemExit(
+                        f"RAW_REPLAY needs {path} from a previous live run; it does not exist."
+                    )
+            with open(RAW_META_PATH, encoding="utf-8") as f:
+                _check_replay(json.load(f), cfg, end)
+            raw = _load_raw(RAW_PATH)
+            print(f"Replaying {len(raw)} cached rows from {RAW_PATH}")
+            total = len(raw)
+            probe = total_future = None
+            # Serve every cached row: the live run's page size and MAX_PAGES cap already
+            # decided what is in the cache, so this run's settings must not cut it short.
+            max_pages = _expected_pages(total, body["limit"], float("inf"))
+            fetch = partial(_replay_page, raw, body["limit"])
+            rows, meta = fetch(1)
+        else:
+            # The shared session's pool covers the default concurrency; only a larger
+            # PAGE_CONCURRENCY needs a bigger pool of its own.
+            session = SESSION if concurrency <= POOL_SIZE else _build_session(pool_maxsize=concurrency)
+            fetch = partial(_fetch_page, session, body)
+            # Page 1 alone: it tells us whether there is anything worth fanning out over.
+            # The award count is requested alongside it, so the total costs no extra round trip.
+            probe = ThreadPoolExecutor(max_workers=1)
+            total_future = probe.submit(_fetch_total, session, body)
+            rows, meta = _fetch_first_page(session, body)
+            total = meta.get("total")
+        page = 1
+        first_page_meta = meta
+        first_page_sample = rows[:3]
+        print(f"Page 1 results: {len(rows)}")
+        if rows:
+            print(f"Sample Award IDs: {[x.get('Award ID') for x in rows[:5]]}")
+        get_end = _end_date_getter(rows)
+        extract = _compile_extractor(rows)
+        _write_raw(raw_out, rows)
+        last_ed = get_end(rows[-1])[:10] if rows else ""
+        pulled_total += len(rows)
+        disa_total += _filter_rows(rows, disa_only, start, end, kept, seen, get_end, extract)
+        # spending_by_award has no time_period type for End Date, so instead of a server-side
+        # filter, the ascending End Date sort lets pagination stop once pages pass the window.
+        ends_sorted = body["sort"] == "End Date" and body["order"] == "asc"
+        more = bool(rows) and bool(meta.get("hasNext"))
+        past_window = more and ends_sorted and _past_window(rows, get_end, end)
+        more = more and not past_window
+        if not isinstance(total, int):
+            # Only worth waiting on the count probe when there are more pages to size.
+            total = total_future.result() if more and total_future is not None else None
+        if probe is not None:
+            # Never block on the probe past this point: a still-running count is abandoned.
+            probe.shutdown(wait=False, cancel_futures=True)
+        safety_stop = False
+        last_page = _expected_pages(total, body["limit"], max_pages)
+        if total is not None:
+            print(f"Reported total: {total} (expecting {last_page} page(s))")
+
+        # Nothing left after page 1 (no results, no hasNext, or already past the window):
+        # skip the pool entirely.
+        if more:
+            # Remaining pages run on a sliding window: `concurrency` requests stay in flight
+            # and the next page is queued as soon as one is taken, so fetching overlaps the
+            # filtering of pages already received. Pages are consumed in order, so the
+            # empty-page / hasNext stop behaves exactly like the serial loop.
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                inflight = deque()
+                next_page = page + 1
+                while more:
+                    # Keep `concurrency` pages in flight up to the expected last page; past it
+                    # (total missing or undercounted) only one, since hasNext has the final say.
+                    while next_page <= max_pages and len(inflight) < (concurrency if next_page <= last_page else 1):
+                        inflight.append(pool.submit(fetch, next_page))
+                        next_page += 1
+                    if not inflight:
+                        print(f"Stopping at {max_pages} pages (safety stop).")
+                        safety_stop = True
+                        break
+                    rows, meta = inflight.popleft().result()
+                    page += 1
+                    if not rows:
+                        break
+                    _write_raw(raw_out, rows)
+                    get_end = _end_date_getter(rows[:1])
+                    last_ed = get_end(rows[-1])[:10]
+                    pulled_total += len(rows)
+                    disa_total += _filter_rows(rows, disa_only, start, end, kept, seen, get_end, extract)
+                    more = bool(meta.get("hasNext"))
+                    past_window = more and ends_sorted and _past_window(rows, get_end, end)
+                    more = more and not past_window
+                # Pages queued past the end are never needed.
+                for fut in inflight:
+                    fut.cancel()
+        if past_window:
+            print(f"Stopping after page {page}: End Dates are past {end}.")
+    except BaseException:
+        if raw_out is not None:
+            raw_out.close()
+            os.remove(raw_out.name)
+        raise
+    finally:
+        if raw_out is not None:
+            raw_out.close()
+    if raw_out is not None:
+        os.replace(RAW_PATH + ".tmp", RAW_PATH)
+        raw_meta = {
+            "psc_codes": list(cfg.psc_codes),
+            "disa_api_filter": cfg.disa_api_filter,
+            "window": {"start": start, "end": end},
+            "complete": not (past_window or safety_stop),
+            "covered_through": last_ed if (past_window or safety_stop) else None,
+        }
+        with open(RAW_META_PATH + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(raw_meta, f, indent=2)
+        os.replace(RAW_META_PATH + ".tmp", RAW_META_PATH)
+
+    # Write CSV (a replay gets its own files so the live outputs are never replaced)
+    suffix = "_replay" if cfg.raw_replay else ""
+    csv_path = f"output/disa_cyber_expiring{suffix}.csv"
+    # 1 MiB buffer: the whole CSV typically goes out in a handful of write() calls.
+    with open(csv_path, "w", newline="", encoding="utf-8", buffering=1 << 20) as f:
+        w = csv.writer(f)
+        w.writerow(FIELDS)
+        w.writerows(kept)
 
     # Always write debug JSON (so if CSV is empty, you still see why)
-    debug_path = "output/disa_cyber_expiring_debug.json"
+    debug_path = f"output/disa_cyber_expiring{suffix}_debug.json"
     debug_obj = {
         "run_date": start_dt.isoformat(),
-        "window": {"start": start_dt.isoformat(), "end": end_dt.isoformat()},
-        "psc_codes": psc_codes,
+        "window": {"start": start, "end": end},
+        "psc_codes": list(cfg.psc_codes),
         "disa_only": disa_only,
+        "disa_api_filter": cfg.disa_api_filter,
+        "raw_replay": cfg.raw_replay,
         "pages_pulled": page,
+        "stopped_past_window": past_window,
+        "stopped_at_max_pages": safety_stop,
+        "page_limit": body["limit"],
+        "reported_total": total,
         "counts": {
-            "pulled_total": len(all_rows),
-            "after_disa_filter": len(disa_rows),
-            "after_end_date_filter": len(filtered),
+            "pulled_total": pulled_total,
+            "unique_awards": len(seen),
+            "after_disa_filter": disa_total,
+            "after_end_date_filter": len(kept),
         },
         "first_page_metadata": first_page_meta,
         "first_page_sample": first_page_sample,
@@ -202,10 +534,13 @@ def main():
     with open(debug_path, "w", encoding="utf-8") as f:
         json.dump(debug_obj, f, indent=2, ensure_ascii=False)
 
-    print(f"Pulled total rows: {len(all_rows)}")
-    print(f"After DISA filter: {len(disa_rows)}")
-    print(f"After End Date window: {len(filtered)}")
+    print(f"Pulled total rows: {pulled_total}")
+    print(f"After DISA filter: {disa_total}")
+    print(f"After End Date window: {len(kept)}")
     print(f"Wrote: {csv_path}")
+    if raw_out is not None:
+        print(f"Wrote: {RAW_PATH}")
+        print(f"Wrote: {RAW_META_PATH}")
     print(f"Wrote: {debug_path}")
 
 if __name__ == "__main__":
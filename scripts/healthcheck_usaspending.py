@@ -1,14 +1,13 @@
 import json
-import requests
+
+from _http import SESSION, _json_body
 
 URL = "https://api.usaspending.gov/api/v2/references/toptier_agencies/"
 
 def main():
-    r = requests.get(URL, timeout=30)
+    r = SESSION.get(URL, timeout=30)
     print("status_code:", r.status_code)
-    r.raise_for_status()
-
-    data = r.json()
+    data = _json_body(r)
     results = data.get("results", [])
     print("results_count:", len(results))
 